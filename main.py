@@ -4,142 +4,351 @@
 import os
 import re
 import asyncio
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
-
+import functools
+import multiprocessing
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+import orjson
+import xxhash
 from aiogram import Bot, Dispatcher
 from aiogram.types import Message, FSInputFile
 from aiogram.filters import Command
 
+from subtitles import Cue, parse_one
+
 # ================== Config ==================
 BOT_TOKEN = os.getenv("TELEGRAM_TOKEN", "").strip()
 DATA_DIR = os.path.abspath(os.getenv("DATA_DIR", "data"))
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# Estimación para duraciones si el texto es .txt (sin tiempos)
-DEFAULT_WPS = 2.5
-MIN_LAST_DUR = 1.2
-
 AUDIO_EXTS = (".mp3", ".wav", ".m4a", ".ogg", ".oga", ".aac", ".flac")
 TEXT_EXTS = (".txt", ".srt", ".vtt")
+AUDIO_SET = frozenset(AUDIO_EXTS)
+ALL_EXTS = frozenset(AUDIO_EXTS + TEXT_EXTS)
 
 PAGE_SIZE   = 100   # elementos por página
 CHUNK_LIMIT = 3500  # tamaño máx. por mensaje de texto
 MSG_BUDGET  = 3900  # seguridad para no tocar el límite de 4096
+# A partir de cuántos subtítulos (cambiados) se parsea en varios procesos.
+# Medido: ~3.7 ms por .srt de 600 líneas frente a ~2 s de arranque por proceso
+# (cada uno vuelve a ejecutar main.py como __mp_main__ e importa aiogram),
+# así que con 4 núcleos solo compensa a partir de unos 700 ficheros.
+PARSE_MIN_PARALLEL = 1000
 
 # ================== Traducción ==================
-from deep_translator import GoogleTranslator
-
-def translate_line(text: str) -> str:
-    """Traduce una línea (auto -> es). Si falla, deja el original."""
+# Endpoint libre de Google Translate. Una sola ClientSession (abierta en main)
+# reutiliza las conexiones TCP/TLS entre peticiones.
+TR_URL = "https://translate.googleapis.com/translate_a/single"
+TR_TIMEOUT = 10  # segundos por petición
+SESSION: Optional[aiohttp.ClientSession] = None
+
+# Caché persistente xxh3_64(texto) -> traducción, en data/trans.db.
+# El hash solo sirve de clave (no necesita ser criptográfico).
+_TRANS_DB: Optional[sqlite3.Connection] = None
+_TRANS_LOCK = threading.Lock()  # la conexión se usa desde hilos de asyncio.to_thread
+
+def _trans_db() -> sqlite3.Connection:
+    global _TRANS_DB
+    if _TRANS_DB is None:
+        _TRANS_DB = sqlite3.connect(os.path.join(DATA_DIR, "trans.db"), check_same_thread=False)
+        _TRANS_DB.execute("CREATE TABLE IF NOT EXISTS tx(h INTEGER PRIMARY KEY, es TEXT)")
+        _TRANS_DB.commit()
+    return _TRANS_DB
+
+def _tr_hash(text: str) -> int:
+    # Desplazado al rango con signo de 64 bits que admite INTEGER en SQLite
+    return xxhash.xxh3_64_intdigest(text.encode("utf-8")) - (1 << 63)
+
+def cache_get(text: str) -> Optional[str]:
+    with _TRANS_LOCK:
+        row = _trans_db().execute("SELECT es FROM tx WHERE h=?", (_tr_hash(text),)).fetchone()
+    return row[0] if row else None
+
+def cache_get_many(texts: List[str]) -> List[Optional[str]]:
+    return [cache_get(t) if t.strip() else None for t in texts]
+
+def cache_put(pairs: List[Tuple[str, str]]) -> None:
+    """Guarda pares (original, traducción); solo se llama con traducciones buenas."""
+    rows = [(_tr_hash(o), es) for o, es in pairs if es]
+    if rows:
+        with _TRANS_LOCK:
+            db = _trans_db()
+            db.executemany("INSERT OR IGNORE INTO tx(h, es) VALUES (?, ?)", rows)
+            db.commit()
+
+async def _gtx(text: str, src: str) -> list:
+    """Una petición (src -> es) sobre la sesión compartida. Lanza excepción si falla."""
+    if SESSION is None:
+        raise RuntimeError("sesión HTTP no iniciada")
+    params = {"client": "gtx", "sl": src, "tl": "es", "dt": "t"}
+    # POST: el texto va en el cuerpo y no choca con el límite de longitud de la URL
+    async with SESSION.post(TR_URL, params=params, data={"q": text}) as r:
+        r.raise_for_status()
+        return await r.json(content_type=None)
+
+async def google_translate(text: str, src: str = "auto") -> Tuple[str, Optional[str]]:
+    """(traducción, idioma de origen que indica Google, p. ej. 'en')."""
+    data = await _gtx(text, src)
+    lang = data[2] if len(data) > 2 and isinstance(data[2], str) else None
+    return "".join(seg[0] for seg in data[0] if seg and seg[0]), lang
+
+async def translate_line(text: str, src: str = "auto") -> str:
+    """Traduce una línea (src -> es). Si falla, deja el original."""
     if not text.strip():
         return ""
+    hit = await asyncio.to_thread(cache_get, text)
+    if hit is not None:
+        return hit
     try:
-        return GoogleTranslator(source="auto", target="es").translate(text)
+        res, _ = await google_translate(text, src)
     except Exception:
         return text
+    await asyncio.to_thread(cache_put, [(text, res)])
+    return res
 
-# ================== Modelos / Estado ==================
-@dataclass
-class Cue:
-    start: float
-    end: float
-    text: str
+TR_SEP = "\n@@@\n"   # separador entre líneas dentro de un lote
+TR_BATCH = 4500       # límite de caracteres por petición (Google ~5000)
+TR_PARALLEL = 8       # lotes traduciéndose a la vez (evita 429)
 
-# Índice global: "root/rel/sin_ext" -> {"audio": path, "cues": List[Cue]}
-MEDIA_DB: Dict[str, Dict[str, object]] = {}
+SEM = asyncio.BoundedSemaphore(TR_PARALLEL)
+
+async def translate_batch(batch: List[str], src: str = "auto") -> Tuple[List[str], Optional[str]]:
+    """
+    Traduce un lote en una sola petición; devuelve también el idioma detectado.
+    Si la respuesta no se deja partir, línea a línea.
+    """
+    lang: Optional[str] = None
+    try:
+        res, lang = await google_translate(TR_SEP.join(batch), src)
+        parts = [p.strip() for p in res.split("@@@")]
+    except Exception:
+        parts = []
+    if len(parts) != len(batch):
+        return [await translate_line(t, src) for t in batch], lang
+    await asyncio.to_thread(cache_put, list(zip(batch, parts)))
+    return parts, lang
 
-# ================== Parsers ==================
-def normalize_text(t: str) -> str:
-    return re.sub(r"<[^>]+>", "", t.replace("\u200b", "").strip())
+async def _tr(batch: List[str], src: str) -> Tuple[List[str], Optional[str]]:
+    async with SEM:
+        return await translate_batch(batch, src)
 
-def parse_ts(s: str) -> float:
-    s = s.strip().replace(",", ".")
-    parts = s.split(":")
-    if len(parts) == 3:
-        return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
-    if len(parts) == 2:
-        return int(parts[0]) * 60 + float(parts[1])
-    return float(parts[0])
-
-def parse_srt_vtt(content: str) -> List[Cue]:
-    lines = content.replace("\r\n", "\n").replace("\r", "\n").splitlines()
-    cues: List[Cue] = []
-    i = 0
-    time_re = re.compile(
-        r"(\d{2}:\d{2}:\d{2}[\.,]\d{3}|\d{2}:\d{2}[\.,]\d{3})\s*-->\s*"
-        r"(\d{2}:\d{2}:\d{2}[\.,]\d{3}|\d{2}:\d{2}[\.,]\d{3})"
-    )
-    if lines and lines[0].strip().upper().startswith("WEBVTT"):
-        lines = lines[1:]
-    while i < len(lines):
-        m = time_re.search(lines[i].strip())
-        if not m and i + 1 < len(lines):
-            m = time_re.search(lines[i + 1].strip())
-            if m:
-                i += 1
-        if m:
-            st = parse_ts(m.group(1))
-            en = parse_ts(m.group(2))
-            i += 1
-            block = []
-            while i < len(lines) and lines[i].strip():
-                block.append(lines[i])
-                i += 1
-            text = normalize_text(" ".join(block))
-            if en > st and text:
-                cues.append(Cue(st, en, text))
-        i += 1
-    return sorted(cues, key=lambda c: c.start)
-
-def parse_txt(content: str) -> List[Cue]:
-    rows = [r for r in content.replace("\r\n", "\n").replace("\r", "\n").splitlines() if r.strip()]
-    cues: List[Cue] = []
-    t0 = 0.0
-    for r in rows:
-        txt = normalize_text(r)
-        dur = max(MIN_LAST_DUR, len(re.findall(r"\w+", txt)) / DEFAULT_WPS)
-        cues.append(Cue(t0, t0 + dur, txt))
-        t0 += dur
-    return cues
+async def translate_lines(texts: List[str], src: str = "auto") -> Tuple[List[str], Optional[str]]:
+    """
+    Traduce varias líneas agrupándolas en lotes de hasta TR_BATCH caracteres
+    (una petición por lote, hasta TR_PARALLEL lotes en paralelo).
+    Las líneas ya presentes en la caché no se envían.
+    Devuelve (traducciones, idioma detectado por Google o None si no hubo petición).
+    """
+    out: List[str] = [""] * len(texts)
+    hits = await asyncio.to_thread(cache_get_many, texts)
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    n = 0
+    for i, (t, hit) in enumerate(zip(texts, hits)):
+        if not t.strip():
+            continue
+        if hit is not None:
+            out[i] = hit
+            continue
+        if cur and n + len(t) + len(TR_SEP) > TR_BATCH:
+            batches.append(cur)
+            cur, n = [], 0
+        cur.append(i)
+        n += len(t) + len(TR_SEP)
+    if cur:
+        batches.append(cur)
+
+    results = await asyncio.gather(*[_tr([texts[i] for i in idx], src) for idx in batches])
+    lang: Optional[str] = None
+    for idx, (parts, batch_lang) in zip(batches, results):
+        lang = lang or batch_lang
+        for i, p in zip(idx, parts):
+            out[i] = p
+    return out, lang
+
+# ================== Modelos / Estado ==================
+# Índice global: "root/rel/sin_ext" -> {"audio": path, "cues": List[Cue], "lang"?: str}
+# ("lang" se rellena en el primer /play que necesite traducir)
+MEDIA_DB: Dict[str, Dict[str, object]] = {}
+
+# Índice en arrays paralelos (orden natural), rehecho en cada preload:
+# KEYS_SORTED[i] es la clave, LAST_NUMS[i] su último número y CUE_COUNTS[i] sus líneas.
+KEYS_SORTED: List[str] = []
+LAST_NUMS: List[Optional[int]] = []
+CUE_COUNTS: List[int] = []
+KEYS_LOWER: List[str] = []   # KEYS_SORTED en minúsculas (búsqueda por subcadena)
+# Para prefijos: claves en minúsculas en orden lexicográfico + su posición en KEYS_SORTED
+PREFIX_KEYS: List[str] = []
+PREFIX_POS: List[int] = []
+# Para /play: clave en minúsculas -> clave, y basename en minúsculas -> claves
+LOWER_TO_KEY: Dict[str, str] = {}
+BASENAME_TO_KEYS: Dict[str, List[str]] = {}
 
 # ================== Indexación local ==================
-def preload_local_media() -> None:
-    """Escanea TODAS las carpetas dentro de data/ y construye MEDIA_DB."""
-    MEDIA_DB.clear()
-    if not os.path.isdir(DATA_DIR):
+def scan_tree(path: str, rel_dir: str = ""):
+    """
+    Como os.walk pero con os.scandir: produce (rel_dir, dirpath, ficheros)
+    usando el tipo que ya da readdir, sin stat extra por entrada.
+    """
+    files: List[str] = []
+    subdirs: List[str] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    files.append(entry.name)
+    except OSError:
         return
+    yield rel_dir, path, files
+    for d in subdirs:
+        yield from scan_tree(os.path.join(path, d), os.path.join(rel_dir, d) if rel_dir else d)
+
+def collect_candidates() -> Dict[str, Dict[str, str]]:
+    """clave -> {"audio": ruta, "subs": ruta} para todo lo que hay en data/."""
+    candidates: Dict[str, Dict[str, str]] = {}
+    if not os.path.isdir(DATA_DIR):
+        return candidates
     roots = [d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d))]
     for root in roots:
         root_path = os.path.join(DATA_DIR, root)
-        candidates: Dict[str, Dict[str, str]] = {}
-        for dirpath, _, files in os.walk(root_path):
-            rel_dir = os.path.relpath(dirpath, root_path)
-            if rel_dir == ".":
-                rel_dir = ""
+        for rel_dir, dirpath, files in scan_tree(root_path):
+            prefix = f"{root}/" if not rel_dir else f"{root}/{rel_dir.replace(os.sep, '/')}/"
             for f in files:
-                ext = os.path.splitext(f)[1].lower()
-                base = os.path.splitext(f)[0]
-                if ext not in AUDIO_EXTS + TEXT_EXTS:
+                base, ext = os.path.splitext(f)
+                ext = ext.lower()
+                if ext not in ALL_EXTS:
                     continue
-                rel_base = base if not rel_dir else f"{rel_dir.replace(os.sep, '/')}/{base}"
-                key = f"{root}/{rel_base}"
-                entry = candidates.setdefault(key, {})
+                entry = candidates.setdefault(prefix + base, {})
                 full = os.path.join(dirpath, f)
-                if ext in AUDIO_EXTS:
+                if ext in AUDIO_SET:
                     entry["audio"] = full
                 else:
                     entry["subs"] = full
-        for key, parts in candidates.items():
-            if "audio" not in parts or "subs" not in parts:
-                continue
-            try:
-                with open(parts["subs"], encoding="utf-8", errors="ignore") as f:
-                    raw = f.read()
-                cues = parse_srt_vtt(raw) if parts["subs"].lower().endswith((".srt", ".vtt")) else parse_txt(raw)
-                MEDIA_DB[key] = {"audio": parts["audio"], "cues": cues}
-            except Exception as e:
-                print(f"[preload] error {key}: {e}")
+    return candidates
+
+# Caché de cues parseados: ruta subs -> ((st_mtime_ns, st_size), cues)
+# En disco (JSON vía orjson): {ruta: [mtime_ns, size, [[start, end, text], ...]]}
+CUES_CACHE_PATH = os.path.join(DATA_DIR, ".cues_cache.json")
+_CUES_CACHE: Optional[Dict[str, Tuple[Tuple[int, int], List[Cue]]]] = None
+_CUES_LOCK = threading.Lock()  # dos /rescan a la vez comparten caché y fichero .tmp
+
+def _cues_cache() -> Dict[str, Tuple[Tuple[int, int], List[Cue]]]:
+    global _CUES_CACHE
+    if _CUES_CACHE is None:
+        try:
+            with open(CUES_CACHE_PATH, "rb") as f:
+                raw = orjson.loads(f.read())
+            _CUES_CACHE = {
+                path: ((mtime, size), [Cue(st, en, txt) for st, en, txt in cues])
+                for path, (mtime, size, cues) in raw.items()
+            }
+        except Exception:
+            _CUES_CACHE = {}
+    return _CUES_CACHE
+
+def _save_cues_cache(cache: Dict[str, Tuple[Tuple[int, int], List[Cue]]]) -> None:
+    tmp = CUES_CACHE_PATH + ".tmp"
+    raw = {
+        path: [sig[0], sig[1], [(c.start, c.end, c.text) for c in cues]]
+        for path, (sig, cues) in cache.items()
+    }
+    try:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(raw))
+        os.replace(tmp, CUES_CACHE_PATH)
+    except OSError as e:
+        print(f"[preload] no pude guardar la caché de cues: {e}")
+
+_PARSE_CTX = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+def parse_all(tasks: List[Tuple[str, str]]) -> List[Tuple[str, Optional[List[Cue]], str]]:
+    """
+    Devuelve los cues de cada subtítulo. Los que no han cambiado (mismo
+    mtime y tamaño) salen de la caché; el resto se parsea en paralelo entre
+    núcleos (con pocos ficheros no compensa arrancar procesos).
+    """
+    with _CUES_LOCK:
+        return _parse_all(tasks)
+
+def _parse_all(tasks: List[Tuple[str, str]]) -> List[Tuple[str, Optional[List[Cue]], str]]:
+    cache = _cues_cache()
+    results: List[Tuple[str, Optional[List[Cue]], str]] = []
+    todo: List[Tuple[str, str]] = []
+    sigs: Dict[str, Tuple[int, int]] = {}
+    for key, subs in tasks:
+        try:
+            st = os.stat(subs)
+        except OSError as e:
+            results.append((key, None, str(e)))
+            continue
+        sig = (st.st_mtime_ns, st.st_size)
+        sigs[subs] = sig
+        hit = cache.get(subs)
+        if hit is not None and hit[0] == sig:
+            results.append((key, hit[1], ""))
+        else:
+            todo.append((key, subs))
+
+    parsed: Optional[List[Tuple[str, Optional[List[Cue]], str]]] = None
+    if len(todo) >= PARSE_MIN_PARALLEL and (os.cpu_count() or 1) > 1:
+        # forkserver: el bot ya tiene hilos (aiohttp, to_thread) y hacer fork
+        # de un proceso multihilo puede bloquearse
+        try:
+            with ProcessPoolExecutor(mp_context=_PARSE_CTX) as ex:
+                parsed = list(ex.map(parse_one, todo, chunksize=8))
+        except (BrokenProcessPool, OSError) as e:
+            print(f"[preload] parseo en paralelo falló ({e}); sigo en serie")
+    if parsed is None:
+        parsed = [parse_one(t) for t in todo]
+    results.extend(parsed)
+
+    fresh = {subs: cache[subs] for subs in sigs if subs in cache and cache[subs][0] == sigs[subs]}
+    for (_, subs), (_, cues, _) in zip(todo, parsed):
+        if cues is not None:
+            fresh[subs] = (sigs[subs], cues)
+    if todo or len(fresh) != len(cache):
+        cache.clear()
+        cache.update(fresh)
+        _save_cues_cache(cache)
+    return results
+
+async def preload_local_media() -> None:
+    """Escanea TODAS las carpetas dentro de data/ y construye MEDIA_DB."""
+    candidates = await asyncio.to_thread(collect_candidates)
+    tasks = [(key, parts["subs"]) for key, parts in candidates.items() if "audio" in parts and "subs" in parts]
+    db: Dict[str, Dict[str, object]] = {}
+    for key, cues, err in await asyncio.to_thread(parse_all, tasks):
+        if cues is None:
+            print(f"[preload] error {key}: {err}")
+            continue
+        db[key] = {"audio": candidates[key]["audio"], "cues": cues}
+    # Se sustituye de golpe para que otros comandos no vean un índice a medias
+    MEDIA_DB.clear()
+    MEDIA_DB.update(db)
+    build_index()
+
+async def translate_material(item: Dict[str, object]) -> List[str]:
+    """
+    Traduce los cues de un material. El idioma que Google detecta en la primera
+    traducción se guarda en el material y se usa como origen a partir de ahí;
+    si todo sale de la caché no hay petición ni detección.
+    """
+    texts = [c.text for c in item["cues"]]  # type: ignore
+    src = item.get("lang") or "auto"
+    out, lang = await translate_lines(texts, src)  # type: ignore
+    if lang and src == "auto":
+        item["lang"] = lang
+    return out
 
 # ================== Helpers de nombre y paginación ==================
 def _clean_material_name(s: str) -> str:
@@ -152,15 +361,16 @@ def _resolve_key(name: str) -> Optional[str]:
     if name in MEDIA_DB:
         return name
     lname = name.lower()
-    for k in MEDIA_DB.keys():
-        if k.lower() == lname:
-            return k
-    candidates = [k for k in MEDIA_DB.keys() if k.lower().endswith("/" + lname) or os.path.basename(k).lower() == lname]
+    if lname in LOWER_TO_KEY:
+        return LOWER_TO_KEY[lname]
+    # Coincidencia por final de ruta: todas comparten basename con lname
+    candidates = BASENAME_TO_KEYS.get(lname.rsplit("/", 1)[-1], [])
+    if "/" in lname:
+        candidates = [k for k in candidates if k.lower().endswith("/" + lname)]
     if len(candidates) == 1:
         return candidates[0]
     if candidates:
-        candidates.sort(key=len)
-        return candidates[-1]
+        return sorted(candidates, key=len)[-1]
     return None
 
 def parse_cmd_with_page(text: str) -> Tuple[str, int]:
@@ -176,18 +386,55 @@ def parse_cmd_with_page(text: str) -> Tuple[str, int]:
     return f"{parts[1]} {parts[2]}", 1
 
 # ---- Ordenación natural y bloques 1–10, 11–20, … ----
-def natsort_key(path: str):
-    """Clave de ordenación natural para evitar que '10' vaya antes que '110'."""
-    tokens: List[object] = []
-    for seg in path.split('/'):
-        for part in re.split(r'(\d+)', seg.lower()):
-            tokens.append(int(part) if part.isdigit() else part)
-    return tokens
+NAT_RE = re.compile(r"(\d+)|([^\d/]+)|/")
+
+@functools.lru_cache(maxsize=65536)
+def natsort_key(path: str) -> Tuple[Tuple[int, object], ...]:
+    """
+    Clave de ordenación natural para evitar que '10' vaya antes que '110'.
+    Cada trozo va etiquetado (-1 = '/', 0 = número, 1 = texto) para que nunca
+    se comparen int y str. El separador va primero para que 'unit1/…' quede
+    antes que 'unit1b/…', y los números antes que el texto, como antes.
+    """
+    return tuple(
+        (0, int(n)) if n else (1, t.lower()) if t else (-1, "")
+        for n, t in NAT_RE.findall(path)
+    )
+
+LAST_NUM_RE = re.compile(r"(\d+)\D*$")
 
 def extract_last_number(key: str) -> Optional[int]:
     """Último número del basename (Track_110 -> 110)."""
-    nums = re.findall(r'\d+', os.path.basename(key))
-    return int(nums[-1]) if nums else None
+    m = LAST_NUM_RE.search(key, key.rfind("/") + 1)
+    return int(m.group(1)) if m else None
+
+def build_index() -> None:
+    """Precalcula orden natural, últimos números y nº de líneas de MEDIA_DB."""
+    keys = sorted(MEDIA_DB, key=natsort_key)
+    KEYS_SORTED[:] = keys
+    LAST_NUMS[:] = [extract_last_number(k) for k in keys]
+    CUE_COUNTS[:] = [len(MEDIA_DB[k].get("cues") or []) for k in keys]  # type: ignore
+    KEYS_LOWER[:] = [k.lower() for k in keys]
+    order = sorted(range(len(keys)), key=KEYS_LOWER.__getitem__)
+    PREFIX_KEYS[:] = [KEYS_LOWER[i] for i in order]
+    PREFIX_POS[:] = order
+    LOWER_TO_KEY.clear()
+    BASENAME_TO_KEYS.clear()
+    for k, kl in zip(keys, KEYS_LOWER):
+        LOWER_TO_KEY[kl] = k
+        BASENAME_TO_KEYS.setdefault(kl.rsplit("/", 1)[-1], []).append(k)
+
+def search_index(q: str) -> List[int]:
+    """
+    Posiciones en KEYS_SORTED que casan con q (ya en minúsculas).
+    'texto*' busca por prefijo con bisect; si no, por subcadena.
+    """
+    if q.endswith("*"):
+        p = q.rstrip("*")
+        lo = bisect_left(PREFIX_KEYS, p)
+        hi = bisect_right(PREFIX_KEYS, p + "\U0010ffff", lo)
+        return sorted(PREFIX_POS[lo:hi])
+    return [i for i, kl in enumerate(KEYS_LOWER) if q in kl]
 
 def range_label_from_n(n: int) -> str:
     """Bloque 1–10, 11–20, etc., para n."""
@@ -195,22 +442,35 @@ def range_label_from_n(n: int) -> str:
     end = start + 9
     return f"{start}–{end}"
 
-def build_page_chunks(keys: List[str], page: int, title: str) -> List[str]:
+def split_chunks(text: str, limit: int = CHUNK_LIMIT) -> List[str]:
+    """Parte `text` en trozos de como mucho `limit`, cortando en un salto de línea si lo hay."""
+    chunks: List[str] = []
+    start, n = 0, len(text)
+    while start < n:
+        end = start + limit
+        if end < n:
+            cut = text.rfind("\n", start + limit // 2, end)
+            if cut > 0:
+                end = cut
+        chunks.append(text[start:end])
+        start = end
+    return [c for c in (c.strip("\n") for c in chunks) if c]
+
+def build_page_chunks(idx: Sequence[int], page: int, title: str) -> List[str]:
     """
     Igual que build_page, pero devuelve **varios trozos** (chunks)
     para enviarlos en mensajes separados si hace falta.
+    `idx` son posiciones crecientes en KEYS_SORTED (ya en orden natural).
     """
-    if not keys:
+    if not idx:
         return [f"{title} (vacío)"]
 
-    keys_sorted = sorted(keys, key=natsort_key)
-
-    total = len(keys_sorted)
+    total = len(idx)
     total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
     page = max(1, min(page, total_pages))
     start = (page - 1) * PAGE_SIZE
     end = min(start + PAGE_SIZE, total)
-    slice_keys = keys_sorted[start:end]
+    slice_idx = idx[start:end]
 
     header = f"{title} (pág. {page}/{total_pages}, total {total}):\n"
     chunks: List[str] = []
@@ -228,8 +488,8 @@ def build_page_chunks(keys: List[str], page: int, title: str) -> List[str]:
         buf += piece
         used += len(piece)
 
-    for k in slice_keys:
-        n = extract_last_number(k)
+    for i in slice_idx:
+        n = LAST_NUMS[i]
         if n is not None:
             bucket = (n - 1) // 10
             if bucket != last_bucket:
@@ -241,7 +501,7 @@ def build_page_chunks(keys: List[str], page: int, title: str) -> List[str]:
                 add("\n[Otros]\n")
                 last_bucket = "otros"
 
-        line = f"• {k} ({len(MEDIA_DB[k].get('cues') or [])} líneas)\n"
+        line = f"• {KEYS_SORTED[i]} ({CUE_COUNTS[i]} líneas)\n"
         add(line)
 
     if buf.strip():
@@ -251,9 +511,6 @@ def build_page_chunks(keys: List[str], page: int, title: str) -> List[str]:
 
 # ================== Auditoría de pares ==================
 def audit_files() -> dict:
-    audio_exts = set(AUDIO_EXTS)
-    text_exts = set(TEXT_EXTS)
-
     if not os.path.isdir(DATA_DIR):
         return {
             "audios": 0,
@@ -269,18 +526,15 @@ def audit_files() -> dict:
     roots = [d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d))]
     for root in roots:
         root_path = os.path.join(DATA_DIR, root)
-        for dirpath, _, files in os.walk(root_path):
-            rel_dir = os.path.relpath(dirpath, root_path)
-            if rel_dir == ".":
-                rel_dir = ""
+        for rel_dir, _, files in scan_tree(root_path):
+            prefix = f"{root}/" if not rel_dir else f"{root}/{rel_dir.replace(os.sep, '/')}/"
             for fname in files:
-                ext = os.path.splitext(fname)[1].lower()
-                if ext not in audio_exts and ext not in text_exts:
+                base, ext = os.path.splitext(fname)
+                ext = ext.lower()
+                if ext not in ALL_EXTS:
                     continue
-                base = os.path.splitext(fname)[0]
-                rel_base = base if not rel_dir else f"{rel_dir.replace(os.sep, '/')}/{base}"
-                key = f"{root}/{rel_base}"
-                if ext in audio_exts:
+                key = prefix + base
+                if ext in AUDIO_SET:
                     audios.add(key)
                 else:
                     texts.add(key)
@@ -302,7 +556,7 @@ async def start_cmd(msg: Message):
     await msg.answer(
         "Hola 👋\n"
         "• /list [página] → ver materiales (paginado, multi-mensaje)\n"
-        "• /search <texto> [página] → filtrar por nombre\n"
+        "• /search <texto> [página] → filtrar por nombre (<texto>* = empieza por)\n"
         "• /rescan → reindexar data/\n"
         "• /missing → audita pares audio/texto\n"
         "• /play <clave|nombre> → audio + texto con traducción debajo"
@@ -310,33 +564,30 @@ async def start_cmd(msg: Message):
 
 @dp.message(Command("list"))
 async def list_cmd(msg: Message):
-    preload_local_media()
-    if not MEDIA_DB:
-        await msg.answer("No he encontrado materiales en data/.")
+    if not KEYS_SORTED:
+        await msg.answer("No he encontrado materiales en data/. Usa /rescan si acabas de añadirlos.")
         return
     _, page = parse_cmd_with_page(msg.text or "/list")
-    keys = list(MEDIA_DB.keys())
-    for chunk in build_page_chunks(keys, page, "Materiales encontrados"):
+    for chunk in build_page_chunks(range(len(KEYS_SORTED)), page, "Materiales encontrados"):
         await msg.answer(chunk)
 
 @dp.message(Command("search"))
 async def search_cmd(msg: Message):
-    preload_local_media()
     query, page = parse_cmd_with_page(msg.text or "/search")
     q = query.strip().lower()
     if not q:
         await msg.answer("Uso: /search <texto> [página]")
         return
-    keys = [k for k in MEDIA_DB.keys() if q in k.lower()]
-    if not keys:
+    idx = search_index(q)
+    if not idx:
         await msg.answer("Sin resultados.")
         return
-    for chunk in build_page_chunks(keys, page, f"Resultados para “{query}”"):
+    for chunk in build_page_chunks(idx, page, f"Resultados para “{query}”"):
         await msg.answer(chunk)
 
 @dp.message(Command("rescan"))
 async def rescan_cmd(msg: Message):
-    preload_local_media()
+    await preload_local_media()
     await msg.answer(f"Reindexado. Total materiales: {len(MEDIA_DB)}")
 
 @dp.message(Command("missing"))
@@ -354,8 +605,8 @@ async def missing_cmd(msg: Message):
     if mt: lines += ["  ejemplos:"] + [f"  - {x}" for x in mt]
     lines += [f"• Textos SIN audio: {len(stats['missing_audio'])}"]
     if ma: lines += ["  ejemplos:"] + [f"  - {x}" for x in ma]
-    for i in range(0, len("\n".join(lines)), CHUNK_LIMIT):
-        await msg.answer("\n".join(lines)[i:i+CHUNK_LIMIT])
+    for chunk in split_chunks("\n".join(lines)):
+        await msg.answer(chunk)
 
 @dp.message(Command("play"))
 async def play_cmd(msg: Message):
@@ -376,31 +627,37 @@ async def play_cmd(msg: Message):
         await msg.answer("Faltan archivos para ese material.")
         return
 
-    # 1) Enviar audio
-    try:
-        await msg.answer_audio(audio=FSInputFile(audio_path), caption=f"▶ {key}")
-    except Exception as e:
-        await msg.answer(f"No pude enviar el audio: {e}")
+    # 1) Enviar audio mientras se traduce (son independientes)
+    originals = [c.text for c in cues]
+    sent, translations = await asyncio.gather(
+        msg.answer_audio(audio=FSInputFile(audio_path), caption=f"▶ {key}"),
+        translate_material(item),
+        return_exceptions=True,
+    )
+    if isinstance(sent, Exception):
+        await msg.answer(f"No pude enviar el audio: {sent}")
         return
+    if isinstance(translations, BaseException):
+        raise translations
 
     # 2) Enviar texto original + traducción debajo (sin fonética)
-    out_lines: List[str] = []
-    for c in cues:
-        orig = c.text
-        trans = translate_line(orig)
-        out_lines.append(f"{orig}\n{trans}\n")
-
-    full_text = "\n".join(out_lines).strip()
-    for i in range(0, len(full_text), CHUNK_LIMIT):
-        await msg.answer(full_text[i:i + CHUNK_LIMIT])
+    full_text = "\n".join(f"{orig}\n{trans}\n" for orig, trans in zip(originals, translations)).strip()
+    # En orden: envíos concurrentes pueden llegar desordenados a Telegram
+    for chunk in split_chunks(full_text):
+        await msg.answer(chunk)
 
 # ================== Main ==================
 async def main():
     if not BOT_TOKEN:
         raise RuntimeError("Falta TELEGRAM_TOKEN en el entorno.")
-    preload_local_media()
+    global SESSION
+    await preload_local_media()
+    SESSION = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=TR_TIMEOUT))
     bot = Bot(BOT_TOKEN, parse_mode=None)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await SESSION.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers de subtítulos (.srt/.vtt/.txt). Solo usa la librería estándar:
+parse_one se ejecuta en los procesos del parseo en paralelo.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Estimación para duraciones si el texto es .txt (sin tiempos)
+DEFAULT_WPS = 2.5
+MIN_LAST_DUR = 1.2
+
+@dataclass
+class Cue:
+    start: float
+    end: float
+    text: str
+
+# ================== Parsers ==================
+# Compiladas una sola vez. El tiempo es hh:mm:ss.mmm o mm:ss.mmm; las horas
+# opcionales van en un grupo sin alternativa para no reintentar cada rama.
+TS_RE = re.compile(
+    r"(\d{2}:\d{2}(?::\d{2})?[.,]\d{3})\s*-->\s*"
+    r"(\d{2}:\d{2}(?::\d{2})?[.,]\d{3})"
+)
+BLANK_RE = re.compile(r"\n[^\S\n]*(?=\n)")
+TAG_RE = re.compile(r"<[^>]+>")
+WORD_RE = re.compile(r"\w+")
+
+def normalize_text(t: str) -> str:
+    return TAG_RE.sub("", t.replace("\u200b", "").strip())
+
+def parse_ts(s: str) -> float:
+    s = s.strip().replace(",", ".")
+    parts = s.split(":")
+    if len(parts) == 3:
+        return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
+    if len(parts) == 2:
+        return int(parts[0]) * 60 + float(parts[1])
+    return float(parts[0])
+
+def parse_srt_vtt(content: str) -> List[Cue]:
+    """
+    Una sola pasada de TS_RE sobre todo el fichero: cada '-->' abre un cue
+    cuyo texto va desde la línea siguiente hasta la primera línea en blanco.
+    """
+    text = content.replace("\r\n", "\n").replace("\r", "\n")
+    cues: List[Cue] = []
+    pos = 0
+    for m in TS_RE.finditer(text):
+        if m.start() < pos:
+            continue  # '-->' dentro del texto de un cue anterior
+        body = text.find("\n", m.end())
+        if body < 0:
+            break
+        blank = BLANK_RE.search(text, body)
+        pos = blank.start() if blank else len(text)
+        st = parse_ts(m.group(1))
+        en = parse_ts(m.group(2))
+        block = normalize_text(text[body + 1:pos].replace("\n", " "))
+        if en > st and block:
+            cues.append(Cue(st, en, block))
+    return cues
+
+def parse_txt(content: str) -> List[Cue]:
+    rows = [r for r in content.replace("\r\n", "\n").replace("\r", "\n").splitlines() if r.strip()]
+    cues: List[Cue] = []
+    t0 = 0.0
+    for r in rows:
+        txt = normalize_text(r)
+        dur = max(MIN_LAST_DUR, len(WORD_RE.findall(txt)) / DEFAULT_WPS)
+        cues.append(Cue(t0, t0 + dur, txt))
+        t0 += dur
+    return cues
+
+# ================== Tarea de parseo ==================
+def parse_one(task: Tuple[str, str]) -> Tuple[str, Optional[List[Cue]], str]:
+    """(clave, ruta subs) -> (clave, cues, error). Se ejecuta en los procesos del parseo."""
+    key, subs = task
+    try:
+        with open(subs, encoding="utf-8", errors="ignore") as f:
+            raw = f.read()
+        cues = parse_srt_vtt(raw) if subs.lower().endswith((".srt", ".vtt")) else parse_txt(raw)
+        return key, cues, ""
+    except Exception as e:
+        return key, None, str(e)